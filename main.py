@@ -1,15 +1,20 @@
 from typing import Union
 from datetime import datetime
+from contextlib import asynccontextmanager
+import os
 import uvicorn
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 from router.video_router import router as video_router
+from utils.download import VideoType
+from utils.wopan import close_uploaders
 
 # 加载 .env 文件
 load_dotenv()
@@ -21,10 +26,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时一次性创建临时目录，避免每个请求都执行 mkdir
+    temp_dir = Path(__file__).parent / "temp"
+    for name in [t.value for t in VideoType] + ["uploads"]:
+        (temp_dir / name).mkdir(parents=True, exist_ok=True)
+    yield
+    # 关闭联通网盘上传客户端的连接池
+    await close_uploaders()
+
+
 app = FastAPI(
     title="Cloudflare Speed Test API",
     description="视频下载服务 API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS
@@ -44,7 +63,7 @@ static_dir.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(static_dir), html=True), name="static")
 
 @app.get("/healthy")
-def healthy() -> Union[dict, str]:
+async def healthy() -> Union[dict, str]:
     return {
         "status": "ok",
         "message": "Service is healthy",
@@ -54,8 +73,12 @@ def healthy() -> Union[dict, str]:
 if __name__ == "__main__":
     logger.info("Starting the FastAPI server...")
     uvicorn.run(
-        app, 
+        "main:app",  # 多 worker 需要以导入字符串的方式传入 app
         host="0.0.0.0", 
         port=8000,
+        loop="auto",  # 安装了 uvloop 时自动使用 (Windows 不支持 uvloop，回退到 asyncio)
+        http="httptools",
+        # 下载并发限制、下载缓存等状态都在进程内，多 worker 会成倍放大下载并发，默认单 worker
+        workers=int(os.getenv("WORKERS", "1")),
         log_level="info"
     )
\ No newline at end of file
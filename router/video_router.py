@@ -1,6 +1,8 @@
+import asyncio
 import logging
 import os
-import uuid
+import shutil
+import tempfile
 from pathlib import Path
 from typing import Dict, Any
 
@@ -8,12 +10,15 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel, Field
 
 from server.video_service import VideoService
-from utils.wopan import WopanUploader
+from utils.wopan import get_uploader
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/video", tags=["video"])
 
+# 浏览器上传落盘时的拷贝缓冲区大小
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
 
 class VideoDownloadRequest(BaseModel):
     """视频下载请求模型"""
@@ -98,8 +103,8 @@ async def upload_to_wopan(request: WopanUploadRequest) -> Dict[str, Any]:
         
         logger.info(f"接收到 Wopan 上传请求: file_path={request.file_path}, directory_id={request.directory_id}")
         
-        uploader = WopanUploader(access_token)
-        result = uploader.upload(request.file_path, request.directory_id)
+        uploader = get_uploader(access_token)
+        result = await uploader.upload(request.file_path, request.directory_id)
         
         return {
             "status": "success",
@@ -133,40 +138,18 @@ async def upload_file_to_wopan(
         if not access_token:
             raise HTTPException(status_code=500, detail="未配置 WOPAN_ACCESS_TOKEN")
 
-        # 保存到临时目录
+        # temp/uploads 已在应用启动时创建；临时文件关闭时自动删除
         temp_dir = Path(__file__).parent.parent / "temp" / "uploads"
-        temp_dir.mkdir(parents=True, exist_ok=True)
-
-        # 保留原始文件名，用 uuid 防冲突
-        suffix = Path(file.filename).suffix
-        safe_name = f"{uuid.uuid4().hex}{suffix}"
-        temp_path = temp_dir / safe_name
-
-        with open(temp_path, "wb") as f:
-            while chunk := await file.read(8 * 1024 * 1024):
-                f.write(chunk)
-
-        logger.info(f"文件已保存到临时路径: {temp_path}")
-
-        # 上传到联通网盘（使用原始文件名）
-        # 临时重命名以保留原始文件名
-        original_path = temp_dir / file.filename
-        renamed = False
-        if not original_path.exists():
-            temp_path.rename(original_path)
-            renamed = True
-            upload_path = original_path
-        else:
-            upload_path = temp_path
-
-        try:
-            uploader = WopanUploader(access_token)
-            result = uploader.upload(str(upload_path), directory_id)
-        finally:
-            # 清理临时文件
-            upload_path.unlink(missing_ok=True)
-            if renamed and temp_path.exists():
-                temp_path.unlink(missing_ok=True)
+        with tempfile.NamedTemporaryFile(dir=temp_dir, suffix=Path(file.filename).suffix) as tmp:
+            # copyfileobj 内部复用同一块缓冲区，放到线程池中避免阻塞事件循环
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, COPY_BUFFER_SIZE)
+            tmp.flush()
+
+            logger.info(f"文件已保存到临时路径: {tmp.name}")
+
+            # 直接复用已打开的文件上传到联通网盘（使用原始文件名）
+            uploader = get_uploader(access_token)
+            result = await uploader.upload_fileobj(tmp, Path(file.filename).name, directory_id)
 
         return {
             "status": "success",
@@ -1,17 +1,78 @@
+import asyncio
 import logging
 import os
-from pathlib import Path
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
 
-from utils.download import download_video
-from utils.wopan import WopanUploader
+from utils.download import download_video, lookup_cached
+from utils.wopan import get_uploader
 
 logger = logging.getLogger(__name__)
 
+# 按视频类型限制同时进行的下载数，避免带宽争抢和并发合并导致内存耗尽
+_DOWNLOAD_LIMITS: Dict[str, int] = {
+    "youtube": 4,
+    "tiktok": 8,
+    "twitter": 8,
+}
+_DOWNLOAD_SEMAPHORES: Dict[str, asyncio.Semaphore] = {
+    video_type: asyncio.Semaphore(limit) for video_type, limit in _DOWNLOAD_LIMITS.items()
+}
+
+# yt-dlp 下载专用线程池，容量等于各类型并发上限之和：
+# 长时间的下载不会占满默认线程池，上传读盘、stat 等短 I/O 不必排队
+_DOWNLOAD_EXECUTOR = ThreadPoolExecutor(
+    max_workers=sum(_DOWNLOAD_LIMITS.values()),
+    thread_name_prefix="yt-dlp"
+)
+
 
 class VideoService:
     """视频下载服务"""
     
+    # 正在进行中的下载：(video_url, video_type) -> Task[(file_path, ext)]
+    _inflight: Dict[Tuple[str, str], "asyncio.Task[Tuple[str, str]]"] = {}
+    
+    @staticmethod
+    async def _run_download(video_url: str, video_type: str, semaphore: asyncio.Semaphore) -> Tuple[str, str]:
+        """在并发限制内执行一次下载"""
+        # yt-dlp 是同步阻塞调用，放到专用线程池中执行，避免阻塞事件循环
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_DOWNLOAD_EXECUTOR, download_video, video_url, video_type)
+    
+    @staticmethod
+    async def _download_once(video_url: str, video_type: str) -> Tuple[str, str]:
+        """
+        下载视频，相同 (video_url, video_type) 的并发请求共享同一次下载
+        
+        下载运行在独立的 Task 中，任何一个请求（包括发起者）被取消都不会影响其他等待者。
+        事件循环是单线程的，查询和登记 _inflight 之间没有 await，无需额外加锁。
+        """
+        key = (video_url, video_type.lower())
+        task = VideoService._inflight.get(key)
+        if task is not None:
+            logger.info(f"复用进行中的下载: type={video_type}, url={video_url}")
+        else:
+            semaphore = _DOWNLOAD_SEMAPHORES.get(key[1])
+            if semaphore is None:
+                raise ValueError(f"不支持的视频类型: {video_type}")
+            
+            task = asyncio.ensure_future(VideoService._run_download(video_url, video_type, semaphore))
+            VideoService._inflight[key] = task
+            task.add_done_callback(lambda t: VideoService._on_download_done(key, t))
+        
+        # shield: 单个等待者被取消时不影响共享的下载
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    def _on_download_done(key: Tuple[str, str], task: "asyncio.Task[Tuple[str, str]]") -> None:
+        """下载结束后移除登记"""
+        VideoService._inflight.pop(key, None)
+        # 标记异常已被读取，所有等待者都已取消时避免 "never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+    
     @staticmethod
     async def download_and_save(
         video_url: str, 
@@ -28,14 +89,20 @@ class VideoService:
             Dict 包含下载结果
         """
         try:
-            file_path, ext = download_video(video_url, video_type)
-            
-            # 验证文件是否存在
-            if not Path(file_path).exists():
-                raise FileNotFoundError(f"文件未找到: {file_path}")
-            
-            # 获取文件大小
-            file_size = Path(file_path).stat().st_size
+            # 先查下载缓存：命中只需一次 stat（同时得到文件大小），不必排队等待下载并发名额。
+            # 直接在事件循环上执行，不经过线程池
+            cached = lookup_cached(video_url, video_type)
+            if cached is not None:
+                file_path, ext, file_size = cached
+                logger.info(f"命中下载缓存: {file_path}")
+            else:
+                file_path, ext = await VideoService._download_once(video_url, video_type)
+                
+                # 一次 stat 同时验证文件存在并获取文件大小
+                try:
+                    file_size = (await asyncio.to_thread(os.stat, file_path)).st_size
+                except FileNotFoundError:
+                    raise FileNotFoundError(f"文件未找到: {file_path}")
             
             result = {
                 "status": "success",
@@ -50,8 +117,8 @@ class VideoService:
             # 如果提供了 token，则上传到联通网盘
             if wopan_access_token:
                 try:
-                    uploader = WopanUploader(wopan_access_token)
-                    upload_res = uploader.upload(file_path)
+                    uploader = get_uploader(wopan_access_token)
+                    upload_res = await uploader.upload(file_path)
                     result["upload_result"] = upload_res
                     result["message"] += "，并成功上传到联通网盘"
                 except Exception as e:
@@ -1,8 +1,11 @@
 import os
 import uuid
 import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import logging
 from enum import Enum
 from time import sleep
@@ -14,6 +17,19 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# 文件名清理：非法字符直接移除，空格替换为下划线
+_FILENAME_TRANSLATION = str.maketrans({' ': '_', **dict.fromkeys('/\\:*?"<>|')})
+_UNDERSCORES_RE = re.compile(r'_+')
+
+# 下载结果缓存：(video_url, video_type) -> (file_path, ext)，超出容量时淘汰最久未用的条目并删除文件
+_CACHE_MAX_ENTRIES = 128
+_CACHE: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+# YoutubeDL 实例池：按视频类型复用，避免每次请求重新初始化提取器、解析配置
+_YDL_POOL: Dict[str, List["YoutubeDL"]] = {}
+_YDL_POOL_LOCK = threading.Lock()
+
 
 class VideoType(str, Enum):
     YOUTUBE = "youtube"
@@ -37,37 +53,110 @@ def download_video(video_url: str, video_type: str) -> Tuple[str, str]:
     except ValueError:
         raise ValueError(f"不支持的视频类型: {video_type}")
     
-    # 创建目标目录
-    temp_dir = Path(__file__).parent.parent / "temp" / video_type.value
-    temp_dir.mkdir(parents=True, exist_ok=True)
+    cache_key = (video_url, video_type.value)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"命中下载缓存: {cached[0]}")
+        return cached[0], cached[1]
     
-    # 获取视频标题
-    video_title = _get_video_title(video_url)
-    # 清理标题中的非法文件名字符
-    safe_title = _sanitize_filename(video_title)
-    # 生成唯一文件名：title_uuid的前8位
-    uuid_short = str(uuid.uuid4())[:8]
-    file_id = f"{safe_title}_{uuid_short}"
+    # 目标目录已在应用启动时创建
+    temp_dir = Path(__file__).parent.parent / "temp" / video_type.value
     
     if video_type == VideoType.YOUTUBE:
-        return _download_youtube(video_url, temp_dir, file_id)
+        result = _download_youtube(video_url, temp_dir)
     elif video_type == VideoType.TIKTOK:
-        return _download_tiktok(video_url, temp_dir, file_id)
+        result = _download_tiktok(video_url, temp_dir)
     elif video_type == VideoType.TWITTER:
-        return _download_twitter(video_url, temp_dir, file_id)
+        result = _download_twitter(video_url, temp_dir)
+    
+    _cache_put(cache_key, result)
+    return result
+
+
+def lookup_cached(video_url: str, video_type: str) -> Optional[Tuple[str, str, int]]:
+    """
+    查询下载缓存，命中且文件仍存在时返回 (file_path, ext, file_size)
+    
+    只做一次 stat 并返回文件大小，调用方可以在占用下载并发名额之前先查询，命中时无需再次 stat。
+    """
+    cached = _cache_get((video_url, video_type.lower()))
+    if cached is None:
+        return None
+    file_path, ext, st = cached
+    return file_path, ext, st.st_size
+
+
+def _cache_get(key: Tuple[str, str]) -> Optional[Tuple[str, str, os.stat_result]]:
+    """查询下载缓存，返回 (file_path, ext, stat)；文件已不存在时丢弃该条目"""
+    with _CACHE_LOCK:
+        cached = _CACHE.get(key)
+        if cached is None:
+            return None
+        try:
+            st = os.stat(cached[0])
+        except FileNotFoundError:
+            del _CACHE[key]
+            return None
+        _CACHE.move_to_end(key)
+        return cached[0], cached[1], st
+
+
+def _cache_put(key: Tuple[str, str], value: Tuple[str, str]) -> None:
+    """写入下载缓存，超出容量时删除最旧条目对应的文件"""
+    with _CACHE_LOCK:
+        _CACHE[key] = value
+        _CACHE.move_to_end(key)
+        evicted = []
+        while len(_CACHE) > _CACHE_MAX_ENTRIES:
+            evicted.append(_CACHE.popitem(last=False)[1])
+    
+    for file_path, _ in evicted:
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logger.warning(f"清理缓存文件失败: {file_path}, {e}")
+
+
+@contextmanager
+def _pooled_ydl(video_type: VideoType, ydl_opts: Dict[str, Any]) -> Iterator["YoutubeDL"]:
+    """
+    从实例池借出一个 YoutubeDL，用完归还
+    
+    YoutubeDL 不是线程安全的，每个实例同一时间只借给一个下载线程；
+    池的大小由上层的并发限制自然约束。出错的实例直接关闭，不再复用。
+    """
+    with _YDL_POOL_LOCK:
+        pool = _YDL_POOL.setdefault(video_type, [])
+        ydl = pool.pop() if pool else None
+    if ydl is None:
+        ydl = YoutubeDL(ydl_opts)
+    
+    try:
+        yield ydl
+    except BaseException:
+        ydl.close()
+        raise
+    
+    with _YDL_POOL_LOCK:
+        _YDL_POOL[video_type].append(ydl)
+
+
+def _build_file_id(info: Dict[str, Any]) -> str:
+    """根据视频信息生成唯一文件名：title_uuid的前8位"""
+    # 清理标题中的非法文件名字符
+    safe_title = _sanitize_filename(info.get('title') or 'video')
+    uuid_short = str(uuid.uuid4())[:8]
+    return f"{safe_title}_{uuid_short}"
 
 
-def _download_youtube(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str, str]:
+def _download_youtube(video_url: str, temp_dir: Path) -> Tuple[str, str]:
     """下载 YouTube 视频 (1080p 有声音)"""
     if YoutubeDL is None:
         raise RuntimeError("yt-dlp 未安装，请运行: pip install yt-dlp")
     
-    output_template = str(temp_dir / file_id) + ".%(ext)s"
-    
     ydl_opts = {
         'format': 'bestvideo[height>=1080][ext=mp4]+bestaudio[ext=m4a]/best[height>=1080]/best',
         'merge_output_format': 'mp4',
-        'outtmpl': output_template,
         'quiet': False,
         'no_warnings': False,
         'socket_timeout': 60,  # 增加超时到 60 秒
@@ -77,6 +166,8 @@ def _download_youtube(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str
         'retries': 3,  # 添加重试机制
         'fragment_retries': 3,
         'skip_unavailable_fragments': True,  # 跳过不可用的分片
+        'concurrent_fragment_downloads': 8,  # 并发下载 HLS/DASH 分片
+        'http_chunk_size': 10 * 1024 * 1024,  # 按 10MB 分块请求，规避限速
         'extractor_args': {
             'youtube': {
                 'skip': ['webpage']  # 跳过网页信息获取，加速
@@ -90,9 +181,13 @@ def _download_youtube(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with YoutubeDL(ydl_opts) as ydl:
+            with _pooled_ydl(VideoType.YOUTUBE, ydl_opts) as ydl:
                 logger.info(f"开始下载 YouTube 视频 (尝试 {attempt + 1}/{max_retries}): {video_url}")
-                info = ydl.extract_info(video_url, download=True)
+                # 只解析一次视频信息，标题和下载共用同一份结果
+                info = ydl.extract_info(video_url, download=False)
+                file_id = _build_file_id(info)
+                ydl.params['outtmpl']['default'] = str(temp_dir / file_id) + ".%(ext)s"
+                info = ydl.process_ie_result(info, download=True)
                 ext = info.get('ext', 'mp4')
                 file_path = str(temp_dir / f"{file_id}.{ext}")
                 logger.info(f"YouTube 视频下载完成: {file_path}")
@@ -108,16 +203,13 @@ def _download_youtube(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str
             raise
 
 
-def _download_tiktok(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str, str]:
+def _download_tiktok(video_url: str, temp_dir: Path) -> Tuple[str, str]:
     """下载 TikTok 视频"""
     if YoutubeDL is None:
         raise RuntimeError("yt-dlp 未安装，请运行: pip install yt-dlp")
     
-    output_template = str(temp_dir / file_id) + ".%(ext)s"
-    
     ydl_opts = {
         'format': 'best',
-        'outtmpl': output_template,
         'quiet': False,
         'no_warnings': False,
         'socket_timeout': 60,
@@ -127,15 +219,21 @@ def _download_tiktok(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str,
         'retries': 3,
         'fragment_retries': 3,
         'skip_unavailable_fragments': True,
+        'concurrent_fragment_downloads': 8,
+        'http_chunk_size': 10 * 1024 * 1024,
         'no_check_certificate': True,
     }
     
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with YoutubeDL(ydl_opts) as ydl:
+            with _pooled_ydl(VideoType.TIKTOK, ydl_opts) as ydl:
                 logger.info(f"开始下载 TikTok 视频 (尝试 {attempt + 1}/{max_retries}): {video_url}")
-                info = ydl.extract_info(video_url, download=True)
+                # 只解析一次视频信息，标题和下载共用同一份结果
+                info = ydl.extract_info(video_url, download=False)
+                file_id = _build_file_id(info)
+                ydl.params['outtmpl']['default'] = str(temp_dir / file_id) + ".%(ext)s"
+                info = ydl.process_ie_result(info, download=True)
                 ext = info.get('ext', 'mp4')
                 file_path = str(temp_dir / f"{file_id}.{ext}")
                 logger.info(f"TikTok 视频下载完成: {file_path}")
@@ -151,16 +249,13 @@ def _download_tiktok(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str,
             raise
 
 
-def _download_twitter(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str, str]:
+def _download_twitter(video_url: str, temp_dir: Path) -> Tuple[str, str]:
     """下载 Twitter 视频"""
     if YoutubeDL is None:
         raise RuntimeError("yt-dlp 未安装，请运行: pip install yt-dlp")
     
-    output_template = str(temp_dir / file_id) + ".%(ext)s"
-    
     ydl_opts = {
         'format': 'best',
-        'outtmpl': output_template,
         'quiet': False,
         'no_warnings': False,
         'socket_timeout': 60,
@@ -170,15 +265,21 @@ def _download_twitter(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str
         'retries': 3,
         'fragment_retries': 3,
         'skip_unavailable_fragments': True,
+        'concurrent_fragment_downloads': 8,
+        'http_chunk_size': 10 * 1024 * 1024,
         'no_check_certificate': True,
     }
     
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with YoutubeDL(ydl_opts) as ydl:
+            with _pooled_ydl(VideoType.TWITTER, ydl_opts) as ydl:
                 logger.info(f"开始下载 Twitter 视频 (尝试 {attempt + 1}/{max_retries}): {video_url}")
-                info = ydl.extract_info(video_url, download=True)
+                # 只解析一次视频信息，标题和下载共用同一份结果
+                info = ydl.extract_info(video_url, download=False)
+                file_id = _build_file_id(info)
+                ydl.params['outtmpl']['default'] = str(temp_dir / file_id) + ".%(ext)s"
+                info = ydl.process_ie_result(info, download=True)
                 ext = info.get('ext', 'mp4')
                 file_path = str(temp_dir / f"{file_id}.{ext}")
                 logger.info(f"Twitter 视频下载完成: {file_path}")
@@ -194,43 +295,6 @@ def _download_twitter(video_url: str, temp_dir: Path, file_id: str) -> Tuple[str
             raise
 
 
-def _get_video_title(video_url: str) -> str:
-    """获取视频标题"""
-    if YoutubeDL is None:
-        raise RuntimeError("yt-dlp 未安装，请运行: pip install yt-dlp")
-    
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'socket_timeout': 60,
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        },
-        'retries': 2,
-        'no_check_certificate': True,
-    }
-    
-    max_retries = 2
-    for attempt in range(max_retries):
-        try:
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=False)
-                title = info.get('title', 'video')
-                logger.info(f"获取视频标题: {title}")
-                return title
-        except Exception as e:
-            error_msg = str(e)
-            if 'SSL' in error_msg or 'UNEXPECTED_EOF' in error_msg:
-                if attempt < max_retries - 1:
-                    logger.warning(f"获取标题时 SSL 错误，重试: {error_msg}")
-                    sleep(2)
-                    continue
-            logger.warning(f"获取视频标题失败，使用默认值: {error_msg}")
-            return 'video'
-    
-    return 'video'
-
-
 def _sanitize_filename(filename: str, max_length: int = 50) -> str:
     """
     清理文件名，移除非法字符
@@ -242,16 +306,9 @@ def _sanitize_filename(filename: str, max_length: int = 50) -> str:
     Returns:
         清理后的文件名
     """
-    import re
-    # 移除非法字符：/ \ : * ? " < > |
-    sanitized = re.sub(r'[/\\:*?"<>|]', '', filename)
-    # 替换空格为下划线
-    sanitized = sanitized.replace(' ', '_')
-    # 移除多余下划线
-    sanitized = re.sub(r'_+', '_', sanitized)
-    # 限制长度
-    sanitized = sanitized[:max_length]
-    # 移除末尾下划线
-    sanitized = sanitized.rstrip('_')
+    # 一次 translate 完成：移除非法字符 / \ : * ? " < > |，空格替换为下划线
+    sanitized = filename.translate(_FILENAME_TRANSLATION)
+    # 移除多余下划线，限制长度，移除末尾下划线
+    sanitized = _UNDERSCORES_RE.sub('_', sanitized)[:max_length].rstrip('_')
     
     return sanitized if sanitized else 'video'
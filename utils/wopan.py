@@ -1,51 +1,167 @@
+import asyncio
 import json
 import base64
 import time
 import os
 import logging
-import requests
-import pyaes
-import random
-import string
-import math
+import re
+import threading
+import httpx
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from types import MappingProxyType
+from typing import Dict
 
 logger = logging.getLogger(__name__)
 
+# File extension -> Wopan file type code
+_EXT_TYPE = {
+    **dict.fromkeys(['jpg', 'jpeg', 'png', 'bmp', 'gif'], "1"),
+    **dict.fromkeys(['mp4', 'mkv', 'avi', 'mov', 'flv'], "2"),
+    **dict.fromkeys(['mp3', 'wav', 'flac'], "3"),
+    **dict.fromkeys(['doc', 'docx', 'pdf', 'txt'], "4"),
+}
+
+# Escapes applied to multipart header parameters (HTML5 form encoding, as used by httpx)
+_FORM_PARAM_ESCAPES = {'"': "%22", "\\": "\\\\", **{chr(c): f"%{c:02X}" for c in range(0x20) if c != 0x1B}}
+_FORM_PARAM_RE = re.compile("|".join(re.escape(c) for c in _FORM_PARAM_ESCAPES))
+
+
+def _form_param(value: str) -> bytes:
+    """Quote a multipart header parameter the way browsers (and httpx) do"""
+    return _FORM_PARAM_RE.sub(lambda m: _FORM_PARAM_ESCAPES[m.group(0)], value).encode("utf-8")
+
+
+class _PartSource:
+    """
+    Open binary file shared by all parts of one upload.
+
+    Reads run in worker threads, and cancelling an asyncio task does not stop its
+    thread. Once the upload finishes, detach() makes any straggling read fail instead
+    of touching a file the caller may already have closed (or whose fd was reused).
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._lock = threading.Lock()
+        self._detached = False
+
+    def read_at(self, offset: int, n: int) -> bytes:
+        # seek+read must not interleave between parts, nor race with detach()
+        with self._lock:
+            if self._detached:
+                raise ValueError("Upload source is no longer available")
+            self._f.seek(offset)
+            return self._f.read(n)
+
+    def detach(self) -> None:
+        """Stop all further reads; waits for a read in progress to finish"""
+        with self._lock:
+            self._detached = True
+
+
+class _PartBody:
+    """
+    Multipart body for one upload part: the form fields followed by `size` bytes
+    starting at `offset` in an open binary file.
+
+    httpx's own multipart encoder reads file fields with blocking read() calls on the
+    event loop, so the body is encoded here and the file is read in asyncio.to_thread.
+    The object is re-iterable (every pass re-reads the file) while its source is
+    attached, so a failed request can simply be sent again.
+    """
+
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, data: dict, file_name: str, source: _PartSource, offset: int, size: int):
+        boundary = os.urandom(16).hex().encode("ascii")
+        head = []
+        for name, value in data.items():
+            head.append(b"--%s\r\nContent-Disposition: form-data; name=\"%s\"\r\n\r\n%s\r\n"
+                        % (boundary, _form_param(name), str(value).encode("utf-8")))
+        head.append(b"--%s\r\nContent-Disposition: form-data; name=\"file\"; filename=\"%s\"\r\n"
+                    b"Content-Type: application/octet-stream\r\n\r\n" % (boundary, _form_param(file_name)))
+        self._head = b"".join(head)
+        self._tail = b"\r\n--%s--\r\n" % boundary
+        self._source = source
+        self._offset = offset
+        self._size = size
+        self.content_type = f"multipart/form-data; boundary={boundary.decode('ascii')}"
+        self.content_length = len(self._head) + size + len(self._tail)
+
+    async def __aiter__(self):
+        yield self._head
+        pos = 0
+        while pos < self._size:
+            chunk = await asyncio.to_thread(self._source.read_at, self._offset + pos, min(self.READ_SIZE, self._size - pos))
+            if not chunk:
+                raise IOError(f"File truncated while uploading (expected {self._size} bytes at offset {self._offset})")
+            pos += len(chunk)
+            yield chunk
+        yield self._tail
+
+
 class WopanUploader:
     UPLOAD_URL = "https://tjupload.pan.wo.cn/openapi/client/upload2C"
     CHUNK_SIZE = 8 * 1024 * 1024  # 8MB chunks (Aligned with SDK)
+    MAX_CONCURRENT_PARTS = 4  # Parts uploaded in parallel per file
     IV = b"wNSOYIB1k1DjY5lA"
+    _RETRY_STATUSES = frozenset({502, 503, 504})
+    _STATIC_HEADERS = MappingProxyType({
+        "Origin": "https://pan.wo.cn",
+        "Referer": "https://pan.wo.cn/",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    })
 
     def __init__(self, access_token: str):
         self.access_token = access_token
+        self._chunk_size_str = str(self.CHUNK_SIZE)
+        # Shared HTTP/2 client: concurrent uploads multiplex over one warm connection,
+        # and the pool keeps connections alive between parts and uploads
+        self._client = httpx.AsyncClient(
+            headers=self._STATIC_HEADERS,
+            timeout=120,  # Generous timeout for large chunks
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,  # Failed connection attempts are retried by the pool itself
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=8)
+            )
+        )
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client"""
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "WopanUploader":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
 
     def _get_file_type(self, filename: str) -> str:
         """Get file type code based on extension"""
         ext = os.path.splitext(filename)[1].lower().lstrip('.')
-        if ext in ['jpg', 'jpeg', 'png', 'bmp', 'gif']: return "1"
-        if ext in ['mp4', 'mkv', 'avi', 'mov', 'flv']: return "2"
-        if ext in ['mp3', 'wav', 'flac']: return "3"
-        if ext in ['doc', 'docx', 'pdf', 'txt']: return "4"
-        return "5" # Default/Other
+        return _EXT_TYPE.get(ext, "5") # Default/Other
 
     def _encrypt_file_info(self, file_info: dict) -> str:
         """Encrypt file info using AES-128-CBC"""
+        key = self.access_token[:16].encode('utf-8')
+        json_str = json.dumps(file_info, separators=(',', ':')).encode('utf-8')
+        
+        # PKCS7 padding computed inline (pad length is known from the plaintext length),
+        # then AES-CBC via OpenSSL (uses AES-NI when available)
+        pad = 16 - len(json_str) % 16
+        padded = json_str + bytes([pad]) * pad
         try:
-            key = self.access_token[:16].encode('utf-8')
-            json_str = json.dumps(file_info, separators=(',', ':')).encode('utf-8')
-            
-            # Use pyaes's built-in Encrypter with automatic PKCS7 padding
-            aes_mode = pyaes.AESModeOfOperationCBC(key, iv=self.IV)
-            encrypter = pyaes.Encrypter(aes_mode)
-            encrypted = encrypter.feed(json_str)
-            encrypted += encrypter.feed()  # Finalize with padding
-            
-            return base64.b64encode(encrypted).decode('utf-8')
-        except Exception as e:
+            encryptor = Cipher(algorithms.AES(key), modes.CBC(self.IV)).encryptor()
+        except ValueError as e:
+            # e.g. an access token too short to yield a valid AES key
             logger.error(f"Encryption failed: {e}")
             raise
+        encrypted = encryptor.update(padded) + encryptor.finalize()
+        
+        return base64.b64encode(encrypted).decode('utf-8')
 
-    def upload(self, file_path: str, directory_id: str = "0") -> dict:
+    async def upload(self, file_path: str, directory_id: str = "0") -> dict:
         """
         Upload file to Wopan with chunked upload support
         
@@ -57,116 +173,176 @@ class WopanUploader:
             API response dict
         """
         file_path = str(file_path)
-        if not os.path.exists(file_path):
+        # Let open() detect a missing file; the size then comes from fstat on the open fd
+        # Unbuffered: parts seek before every read, so a Python-level buffer would only add copies
+        try:
+            f = open(file_path, "rb", buffering=0)
+        except FileNotFoundError:
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        file_name = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)
+        with f:
+            return await self.upload_fileobj(f, os.path.basename(file_path), directory_id)
+
+    async def upload_fileobj(self, f, file_name: str, directory_id: str = "0") -> dict:
+        """
+        Upload an already open binary file to Wopan with chunked upload support
+        
+        Args:
+            f: Open, seekable binary file object; its current position is ignored
+            file_name: File name shown in Wopan
+            directory_id: Target directory ID (default "0" for root)
+            
+        Returns:
+            API response dict
+        """
+        file_size = os.fstat(f.fileno()).st_size
+        if hasattr(os, "posix_fadvise"):
+            # Hint the kernel to read ahead aggressively (not available on Windows)
+            os.posix_fadvise(f.fileno(), 0, file_size, os.POSIX_FADV_SEQUENTIAL)
         
         logger.info(f"Starting upload to Wopan: {file_name} ({file_size} bytes)")
 
-        # Calculate number of chunks needed (Standard ceil logic)
-        total_parts = math.ceil(file_size / self.CHUNK_SIZE)
-        if total_parts == 0:
-            total_parts = 1
+        # Calculate number of chunks needed (integer ceil, at least one part for empty files)
+        total_parts = max(1, (file_size + self.CHUNK_SIZE - 1) // self.CHUNK_SIZE)
             
         logger.info(f"File will be uploaded in {total_parts} chunks (Chunk size: {self.CHUNK_SIZE} bytes)")
 
         batch_no = time.strftime("%Y%m%d%H%M%S")
         # Generate uniqueId once for the entire upload session
-        unique_id = f"{int(time.time() * 1000)}_{''.join(random.choices(string.ascii_letters, k=6))}"
+        unique_id = f"{time.time_ns() // 1_000_000}_{os.urandom(3).hex()}"
         
+        # fileInfo only depends on the file and batch, so build and encrypt it once per upload
+        file_info = {
+            "spaceType": "0",
+            "directoryId": directory_id,
+            "batchNo": batch_no,
+            "fileName": file_name,
+            "fileSize": file_size,
+            "fileType": self._get_file_type(file_name),
+            # SDK omits empty fields, but let's keep minimal required
+        }
+        encrypted_file_info = self._encrypt_file_info(file_info)
+        
+        # Multipart data shared by all parts (Order matters in some strict servers);
+        # only partSize/partIndex are appended per part
+        data_base = {
+            "uniqueId": unique_id,
+            "accessToken": self.access_token,
+            "fileName": file_name,
+            "psToken": "undefined",
+            "fileSize": str(file_size),
+            "totalPart": str(total_parts),
+            "channel": "wocloud",
+            "directoryId": directory_id,
+            "fileInfo": encrypted_file_info,
+        }
+        
+        # Parts are keyed by partIndex, so they can be sent concurrently; the last part
+        # is only sent after all others succeed so the server still finalizes on it
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_PARTS)
+        source = _PartSource(f)
+
+        async def upload_part(part_index: int) -> dict:
+            async with semaphore:
+                return await self._upload_part(source, file_name, file_size, total_parts, part_index, data_base)
+
+        tasks = [asyncio.ensure_future(upload_part(i)) for i in range(1, total_parts)]
         try:
-            with open(file_path, "rb") as f:
-                for part_index in range(1, total_parts + 1):
-                    # Read chunk
-                    chunk_data = f.read(self.CHUNK_SIZE)
-                    
-                    part_size = len(chunk_data)
-                    
-                    # Prepare file info
-                    file_info = {
-                        "spaceType": "0",
-                        "directoryId": directory_id,
-                        "batchNo": batch_no,
-                        "fileName": file_name,
-                        "fileSize": file_size,
-                        "fileType": self._get_file_type(file_name),
-                        # SDK omits empty fields, but let's keep minimal required
-                    }
-                    
-                    encrypted_file_info = self._encrypt_file_info(file_info)
-                    
-                    headers = {
-                        "Origin": "https://pan.wo.cn",
-                        "Referer": "https://pan.wo.cn/",
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                    }
-                    
-                    # Multipart data (Order matters in some strict servers, though requests handles it)
-                    data = {
-                        "uniqueId": unique_id,
-                        "accessToken": self.access_token,
-                        "fileName": file_name,
-                        "psToken": "undefined",
-                        "fileSize": str(file_size),
-                        "totalPart": str(total_parts),
-                        "channel": "wocloud",
-                        "directoryId": directory_id,
-                        "fileInfo": encrypted_file_info,
-                        "partSize": str(part_size),
-                        "partIndex": str(part_index)
-                    }
-                    
-                    files = {
-                        "file": (file_name, chunk_data, "application/octet-stream")
-                    }
-                    
-                    logger.info(f"Uploading part {part_index}/{total_parts} ({part_size} bytes)...")
-                    
-                    max_retries = 3
-                    for attempt in range(max_retries):
-                        try:
-                            response = requests.post(
-                                self.UPLOAD_URL, 
-                                headers=headers, 
-                                data=data, 
-                                files=files,
-                                timeout=120 # Increased timeout for larger chunks
-                            )
-                            response.raise_for_status()
-                            result = response.json()
-                            
-                            if result.get("code") == "0000":
-                                logger.info(f"Part {part_index} uploaded successfully")
-                                # Check if we got a file ID (fid) in the response data
-                                # This confirms the server has finalized the file
-                                if result.get("data", {}).get("fid"):
-                                    logger.info(f"Upload completed with FID: {result['data']['fid']}")
-                                    return result
-                                
-                                if part_index == total_parts:
-                                    # If it's the last part but no FID, something might be wrong, 
-                                    # but we'll return the result anyway as per current logic.
-                                    # However, the "ghost file" issue suggests we should be wary.
-                                    logger.warning(f"Upload finished but no FID returned in last part. Response: {result}")
-                                    return result
-                                break
-                            else:
-                                logger.error(f"Part {part_index} upload failed with API error: {result}")
-                                if attempt < max_retries - 1:
-                                    logger.info(f"Retrying part {part_index} (attempt {attempt + 2}/{max_retries})...")
-                                    time.sleep(2)
-                                    continue
-                                raise Exception(f"Wopan API Error: {result.get('msg', 'Unknown error')}")
-                        except requests.exceptions.RequestException as e:
-                            logger.warning(f"Part {part_index} upload attempt {attempt + 1} failed: {e}")
-                            if attempt < max_retries - 1:
-                                logger.info(f"Retrying part {part_index} (attempt {attempt + 2}/{max_retries})...")
-                                time.sleep(2 ** attempt)  # Exponential backoff
-                                continue
-                            raise
-                    
-        except Exception as e:
-            logger.error(f"Upload failed: {str(e)}")
+            results = await asyncio.gather(*tasks)
+            results.append(await self._upload_part(source, file_name, file_size, total_parts, total_parts, data_base))
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            # Let the cancelled parts unwind before the caller closes the file
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if isinstance(e, Exception):
+                logger.error(f"Upload failed: {str(e)}")
             raise
+        finally:
+            # The caller closes f once we return; no part read may touch it afterwards
+            source.detach()
+
+        # Check if we got a file ID (fid) in the response data
+        # This confirms the server has finalized the file
+        for result in results:
+            if result.get("data", {}).get("fid"):
+                logger.info(f"Upload completed with FID: {result['data']['fid']}")
+                return result
+
+        # If no part returned a FID, something might be wrong,
+        # but we'll return the last result anyway as per current logic.
+        # However, the "ghost file" issue suggests we should be wary.
+        logger.warning(f"Upload finished but no FID returned in last part. Response: {results[-1]}")
+        return results[-1]
+
+    async def _upload_part(
+        self,
+        source: _PartSource,
+        file_name: str,
+        file_size: int,
+        total_parts: int,
+        part_index: int,
+        data_base: dict
+    ) -> dict:
+        """Upload a single part with retries and return the successful API response"""
+        # Stream this part straight from the file instead of reading it into memory
+        offset = (part_index - 1) * self.CHUNK_SIZE
+        part_size = min(self.CHUNK_SIZE, file_size - offset)
+        
+        # All parts but the last are full size, so reuse the precomputed string for them
+        part_size_str = self._chunk_size_str if part_size == self.CHUNK_SIZE else str(part_size)
+        data = {**data_base, "partSize": part_size_str, "partIndex": str(part_index)}
+        body = _PartBody(data, file_name, source, offset, part_size)
+        
+        # Per-part logs use lazy %-formatting so disabled levels skip string building
+        logger.info("Uploading part %d/%d (%d bytes)...", part_index, total_parts, part_size)
+        
+        # Connection setup failures are retried by the transport; errors after the request
+        # has started (timeouts, resets, gateway errors) are retried here, resending the body
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                response = await self._client.post(
+                    self.UPLOAD_URL, 
+                    content=body, 
+                    headers={"Content-Type": body.content_type, "Content-Length": str(body.content_length)}
+                )
+                if response.status_code not in self._RETRY_STATUSES:
+                    break
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt == max_retries - 1:
+                    raise
+                error = str(e) or type(e).__name__
+            if attempt == max_retries - 1:
+                break
+            logger.warning("Part %d upload attempt %d failed: %s, retrying...", part_index, attempt + 1, error)
+            await asyncio.sleep(2 ** attempt)  # Exponential backoff
+        
+        response.raise_for_status()
+        result = response.json()
+        
+        if result.get("code") != "0000":
+            logger.error("Part %d upload failed with API error: %s", part_index, result)
+            raise Exception(f"Wopan API Error: {result.get('msg', 'Unknown error')}")
+        
+        logger.info("Part %d uploaded successfully", part_index)
+        return result
+
+
+_uploaders: Dict[str, WopanUploader] = {}
+
+
+def get_uploader(access_token: str) -> WopanUploader:
+    """Return a cached uploader for the token so its HTTP connections are reused"""
+    uploader = _uploaders.get(access_token)
+    if uploader is None:
+        uploader = _uploaders[access_token] = WopanUploader(access_token)
+    return uploader
+
+
+async def close_uploaders() -> None:
+    """Close the HTTP clients of all cached uploaders"""
+    while _uploaders:
+        _, uploader = _uploaders.popitem()
+        await uploader.aclose()